@@ -449,7 +449,7 @@ def run(s, g, mapParameters, plt):
                   round(g[2]/mapParameters.yawResolution)]
 
     # Generate all Possible motion commands to car
-    motionCommand = motionCommands()
+    commands = motionCommands()
 
     # Create start and end Node
     startNode = Node(sGridIndex, [s], 0, 1, 0 , tuple(sGridIndex))
@@ -500,8 +500,8 @@ def run(s, g, mapParameters, plt):
             break
 
         # Get all simulated Nodes from current node
-        for i in range(len(motionCommand)):
-            simulatedNode = kinematicSimulationNode(currentNode, motionCommand[i], mapParameters)
+        for i in range(len(commands)):
+            simulatedNode = kinematicSimulationNode(currentNode, commands[i], mapParameters)
 
             # Check if path is within map bounds and is collision free
             if not simulatedNode:
@@ -1,12 +1,18 @@
 import math
 import heapq
+import itertools
 import numpy as np
 import matplotlib.pyplot as plt
-from heapdict import heapdict
-import scipy.spatial.kdtree as kd
 import reeds_shepp as rsCurve
 import time
 
+try:
+    # Kernels compiled ahead of time by running hybrid_a_star_kernels.py
+    from hybrid_a_star_aot import expandAll, checkAll, gridCollision, simulatedPathCost, holonomicDijkstra
+except ImportError:
+    # Fall back to JIT compiling them on first use
+    from hybrid_a_star_kernels import expandAll, checkAll, gridCollision, simulatedPathCost, holonomicDijkstra
+
 class Car:
     maxSteerAngle = 0.6
     steerPresion = 10
@@ -22,32 +28,87 @@ class Cost:
     steerAngleChange = 5
     hybridCost = 50
 
-class Node:
-    def __init__(self, gridIndex, traj, steeringAngle, direction, cost, parentIndex):
-        self.gridIndex = gridIndex         # grid block x, y, yaw index
-        self.traj = traj                   # trajectory x, y  of a simulated node
-        self.steeringAngle = steeringAngle # steering angle throughout the trajectory
-        self.direction = direction         # direction throughout the trajectory
-        self.cost = cost                   # node cost
-        self.parentIndex = parentIndex     # parent node index
-
-class HolonomicNode:
-    def __init__(self, gridIndex, cost, parentIndex):
-        self.gridIndex = gridIndex
-        self.cost = cost
-        self.parentIndex = parentIndex
+def growArray(array, size):
+    # Copy of array with room for size rows
+    grown = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+class NodePool:
+    # Nodes of one search stored column wise, a node is addressed by its integer id (order of insertion).
+    # Trajectories of all nodes are stored back to back in traj, each node keeps the start and length of its rows.
+    # Poses, angles and costs are float32, which is ample for grid resolutions and costs of a parking lot sized map
+    def __init__(self, capacity=4096, trajCapacity=4096*20):
+        self.size = 0                                            # number of nodes
+        self.gridIndex = np.empty((capacity, 3), dtype=np.int64) # grid block x, y, yaw index
+        self.trajStart = np.empty(capacity, dtype=np.int64)      # first trajectory row of the node
+        self.trajLength = np.empty(capacity, dtype=np.int64)     # number of trajectory rows of the node
+        self.steeringAngle = np.empty(capacity, dtype=np.float32) # steering angle throughout the trajectory
+        self.direction = np.empty(capacity, dtype=np.float32)    # direction throughout the trajectory
+        self.cost = np.empty(capacity, dtype=np.float32)         # node cost
+        self.parent = np.empty(capacity, dtype=np.int64)         # parent node id, -1 for the start node
+        self.traj = np.empty((trajCapacity, 3), dtype=np.float32) # trajectory x, y, yaw rows of all nodes
+        self.trajSize = 0                                        # number of used trajectory rows
+
+    def add(self, gridIndex, traj, steeringAngle, direction, cost, parent):
+        # Append a node and return its id, arrays double in size when full
+        if self.size == len(self.cost):
+            capacity = 2 * len(self.cost)
+            self.gridIndex = growArray(self.gridIndex, capacity)
+            self.trajStart = growArray(self.trajStart, capacity)
+            self.trajLength = growArray(self.trajLength, capacity)
+            self.steeringAngle = growArray(self.steeringAngle, capacity)
+            self.direction = growArray(self.direction, capacity)
+            self.cost = growArray(self.cost, capacity)
+            self.parent = growArray(self.parent, capacity)
+
+        if self.trajSize + len(traj) > len(self.traj):
+            self.traj = growArray(self.traj, max(2 * len(self.traj), self.trajSize + len(traj)))
+
+        nodeId = self.size
+        self.gridIndex[nodeId] = gridIndex
+        self.trajStart[nodeId] = self.trajSize
+        self.trajLength[nodeId] = len(traj)
+        self.steeringAngle[nodeId] = steeringAngle
+        self.direction[nodeId] = direction
+        self.cost[nodeId] = cost
+        self.parent[nodeId] = parent
+        self.traj[self.trajSize:self.trajSize + len(traj)] = traj
+
+        self.size += 1
+        self.trajSize += len(traj)
+        return nodeId
+
+    def trajectory(self, nodeId):
+        return self.traj[self.trajStart[nodeId]:self.trajStart[nodeId] + self.trajLength[nodeId]]
+
+    def pose(self, nodeId):
+        # Last x, y, yaw of the node trajectory, as Python floats so that scalar math on them (Reeds-Shepp) avoids NumPy scalar overhead
+        return self.traj[self.trajStart[nodeId] + self.trajLength[nodeId] - 1].tolist()
 
 class MapParameters:
-    def __init__(self, mapMinX, mapMinY, mapMaxX, mapMaxY, xyResolution, yawResolution, ObstacleKDTree, obstacleX, obstacleY):
+    def __init__(self, mapMinX, mapMinY, mapMaxX, mapMaxY, xyResolution, yawResolution, obstacleGrid):
         self.mapMinX = mapMinX               # map min x coordinate(0)
         self.mapMinY = mapMinY               # map min y coordinate(0)
         self.mapMaxX = mapMaxX               # map max x coordinate
         self.mapMaxY = mapMaxY               # map max y coordinate
         self.xyResolution = xyResolution     # grid block length
         self.yawResolution = yawResolution   # grid block possible yaws
-        self.ObstacleKDTree = ObstacleKDTree # KDTree representating obstacles
-        self.obstacleX = obstacleX           # Obstacle x coordinate list
-        self.obstacleY = obstacleY           # Obstacle y coordinate list
+        self.obstacleGrid = np.ascontiguousarray(obstacleGrid, dtype=np.uint8) # Occupancy of every x, y grid block, indexed from mapMinX, mapMinY
+        self.mapMinYaw = round(-math.pi / yawResolution) # min yaw grid index
+        self.mapMaxYaw = round(math.pi / yawResolution)  # max yaw grid index
+
+    def gridShape(self):
+        # Shape of a dense array with one entry per x, y, yaw grid block
+        return (self.mapMaxX - self.mapMinX + 1, self.mapMaxY - self.mapMinY + 1, self.mapMaxYaw - self.mapMinYaw + 1)
+
+    def gridIndex(self, pose):
+        # Grid index of an x, y, yaw pose
+        return [round(pose[0] / self.xyResolution), round(pose[1] / self.xyResolution), round(pose[2] / self.yawResolution)]
+
+    def gridCell(self, gridIndex):
+        # Position of a grid index in an array of shape gridShape()
+        return (gridIndex[0] - self.mapMinX, gridIndex[1] - self.mapMinY, gridIndex[2] - self.mapMinYaw)
 
 def calculateMapParameters(obstacleX_grid, obstacleY_grid, xyResolution, yawResolution):
     # calculate min max map grid index based on obstacles in map
@@ -56,28 +117,34 @@ def calculateMapParameters(obstacleX_grid, obstacleY_grid, xyResolution, yawReso
     mapMaxX = round(max(obstacleX_grid))
     mapMaxY = round(max(obstacleY_grid))
 
-    # Create a KDTree to represent obstacles
-    # Convert grid coordinates to actual coordinates for KDTree
-    obstacleX = [x * xyResolution for x in obstacleX_grid]
-    obstacleY = [y * xyResolution for y in obstacleY_grid]
-    ObstacleKDTree = kd.KDTree([[x, y] for x, y in zip(obstacleX, obstacleY)])
+    # Rasterize the obstacles once into an occupancy grid, every collision check is a lookup into it
+    obstacleGrid = np.zeros((mapMaxX - mapMinX + 1, mapMaxY - mapMinY + 1), dtype=np.uint8)
+    obstacleGrid[np.rint(obstacleX_grid).astype(np.int64) - mapMinX, np.rint(obstacleY_grid).astype(np.int64) - mapMinY] = 1
 
-    return MapParameters(mapMinX, mapMinY, mapMaxX, mapMaxY, xyResolution, yawResolution, ObstacleKDTree, obstacleX, obstacleY)  
-
-def index(Node):
-    # Index is a tuple consisting grid index, used for checking if two nodes are near/same
-    return tuple([Node.gridIndex[0], Node.gridIndex[1], Node.gridIndex[2]])
+    return MapParameters(mapMinX, mapMinY, mapMaxX, mapMaxY, xyResolution, yawResolution, obstacleGrid)  
 
 def motionCommands():
 
     # Motion commands for a Non-Holonomic Robot like a Car or Bicycle (Trajectories using Steer Angle and Direction)
-    direction = 1
-    motionCommand = []
-    # for i in np.arange(Car.maxSteerAngle, -(Car.maxSteerAngle + Car.maxSteerAngle/Car.steerPresion), -Car.maxSteerAngle/Car.steerPresion):
-    for i in np.arange(0.6, -(0.6 + 0.6/Car.steerPresion), -0.6/Car.steerPresion):
-        motionCommand.append([i, direction])
-        motionCommand.append([i, -direction])
-    return motionCommand
+    # One [steer angle, direction] row per command, forward and reverse for every steer angle.
+    # linspace always yields 2*steerPresion+1 steer angles, including both ends
+    steerAngles = np.linspace(Car.maxSteerAngle, -Car.maxSteerAngle, 2*Car.steerPresion + 1, dtype=np.float64)
+    return np.stack([np.repeat(steerAngles, 2), np.tile([1.0, -1.0], steerAngles.size)], axis=1)
+
+# Motion commands are fixed by the Car parameters, so build them once at import
+MOTION_COMMANDS = motionCommands()
+
+# Distance driven by every simulated motion command and its integration step
+SIMULATION_LENGTH = 4
+SIMULATION_STEP = 0.2
+
+# Per motion command, signed distance driven in one integration step and the heading change it causes
+MOTION_STEPS = (MOTION_COMMANDS[:, 1] * SIMULATION_STEP).astype(np.float64)
+MOTION_YAW_STEPS = (MOTION_STEPS / Car.wheelBase * np.tan(MOTION_COMMANDS[:, 0])).astype(np.float64)
+
+# Expansions between two Reeds-Shepp attempts far from the goal, the interval shrinks to 0 close to the goal.
+# Far from the goal most attempts collide with walls in between, 0 attempts from every node
+REEDS_SHEPP_INTERVAL = 10
 
 def holonomicMotionCommands():
 
@@ -85,257 +152,115 @@ def holonomicMotionCommands():
     holonomicMotionCommand = [[-1, 0], [-1, 1], [0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1]]
     return holonomicMotionCommand
 
+# Holonomic action set and the eucledian length of each action, for the heuristic Dijkstra
+HOLONOMIC_MOTION_COMMANDS = np.array(holonomicMotionCommands(), dtype=np.int64)
+HOLONOMIC_MOTION_COSTS = np.hypot(HOLONOMIC_MOTION_COMMANDS[:, 0], HOLONOMIC_MOTION_COMMANDS[:, 1]).astype(np.float32)
 
-def kinematicSimulationNode(currentNode, motionCommand, mapParameters, simulationLength=4, step = 0.2):
 
-    # Simulate node using given current Node and Motion Commands
-    traj = []
-    angle = rsCurve.pi_2_pi(currentNode.traj[-1][2] + motionCommand[1] * step / Car.wheelBase * math.tan(motionCommand[0]))
-    traj.append([currentNode.traj[-1][0] + motionCommand[1] * step * math.cos(angle),
-                currentNode.traj[-1][1] + motionCommand[1] * step * math.sin(angle),
-                rsCurve.pi_2_pi(angle + motionCommand[1] * step / Car.wheelBase * math.tan(motionCommand[0]))])
-    for i in range(int((simulationLength/step))-1):
-        traj.append([traj[i][0] + motionCommand[1] * step * math.cos(traj[i][2]),
-                    traj[i][1] + motionCommand[1] * step * math.sin(traj[i][2]),
-                    rsCurve.pi_2_pi(traj[i][2] + motionCommand[1] * step / Car.wheelBase * math.tan(motionCommand[0]))])
+def expandNode(nodes, currentId, mapParameters):
 
-    # Find grid index
-    gridIndex = [round(traj[-1][0]/mapParameters.xyResolution), \
-                 round(traj[-1][1]/mapParameters.xyResolution), \
-                 round(traj[-1][2]/mapParameters.yawResolution)]
+    # Simulate all motion commands from current Node, one (N, 3) trajectory block per command,
+    # together with the grid index each trajectory ends in and whether it is valid (in map bounds and collision free)
+    x, y, yaw = nodes.pose(currentId)
+    trajs = np.empty((len(MOTION_COMMANDS), int(SIMULATION_LENGTH/SIMULATION_STEP), 3), dtype=np.float32)
+    expandAll(x, y, yaw, MOTION_STEPS, MOTION_YAW_STEPS, trajs)
 
-    # Check if node is valid
-    if not isValid(traj, gridIndex, mapParameters):
-        return None
+    gridIndices = np.empty((len(MOTION_COMMANDS), 3), dtype=np.int64)
+    valid = np.empty(len(MOTION_COMMANDS), dtype=np.bool_)
+    checkAll(trajs, mapParameters.obstacleGrid, mapParameters.mapMinX, mapParameters.mapMinY, mapParameters.mapMaxX, mapParameters.mapMaxY,
+             mapParameters.xyResolution, mapParameters.yawResolution, *carFootprint(mapParameters), gridIndices, valid)
 
-    # Calculate Cost of the node
-    cost = simulatedPathCost(currentNode, motionCommand, simulationLength)
+    return trajs, gridIndices, valid
 
-    return Node(gridIndex, traj, motionCommand[0], motionCommand[1], cost, index(currentNode))
+def reedsSheppNode(nodes, currentId, goal, goalGridIndex, mapParameters):
 
-def reedsSheppNode(currentNode, goalNode, mapParameters):
+    # Add the cheapest collision free Reeds-Shepp path from current node to goal as a node, return its id or None
 
-    # Get x, y, yaw of currentNode and goalNode
-    startX, startY, startYaw = currentNode.traj[-1][0], currentNode.traj[-1][1], currentNode.traj[-1][2]
-    goalX, goalY, goalYaw = goalNode.traj[-1][0], goalNode.traj[-1][1], goalNode.traj[-1][2]
+    # Get x, y, yaw of currentNode and goal
+    startX, startY, startYaw = nodes.pose(currentId)
+    goalX, goalY, goalYaw = goal
 
     # Instantaneous Radius of Curvature
     radius = math.tan(Car.maxSteerAngle)/Car.wheelBase
-    #  Find all possible reeds-shepp paths between current and goal node
-    reedsSheppPaths = rsCurve.calc_all_paths(startX, startY, startYaw, goalX, goalY, goalYaw, radius, mapParameters.xyResolution)
+    #  Find all possible reeds-shepp paths between current and goal node, only segment lengths and types for now
+    reedsSheppPaths = rsCurve.generate_path([startX, startY, startYaw], [goalX, goalY, goalYaw], radius)
 
     # Check if reedsSheppPaths is empty
     if not reedsSheppPaths:
         return None
 
-    # Find path with lowest cost considering non-holonomic constraints
-    costQueue = heapdict()
-    for path in reedsSheppPaths:
-        costQueue[path] = reedsSheppCost(currentNode, path)
+    # Find path with lowest cost considering non-holonomic constraints, lengths scaled to [m] as calc_path_course does
+    costQueue = [(reedsSheppCost(nodes.cost[currentId], [l / radius for l in path.lengths], path.ctypes), i, path)
+                 for i, path in enumerate(reedsSheppPaths)]
+    heapq.heapify(costQueue)
 
-    # Find first path in priority queue that is collision free
-    while len(costQueue)!=0:
-        path = costQueue.popitem()[0]
-        traj=[]
+    # Find first path in priority queue that is collision free, sampling only the paths that get checked
+    while costQueue:
+        cost, _, path = heapq.heappop(costQueue)
+        rsCurve.calc_path_course(path, startX, startY, startYaw, radius, mapParameters.xyResolution)
         traj = [[path.x[k],path.y[k],path.yaw[k]] for k in range(len(path.x))]
         if not collision(traj, mapParameters):
-            cost = reedsSheppCost(currentNode, path)
-            return Node(goalNode.gridIndex ,traj, None, None, cost, index(currentNode))
+            return nodes.add(goalGridIndex, traj, np.nan, np.nan, cost, currentId)
             
     return None
 
-def isValid(traj, gridIndex, mapParameters):
-
-    # Check if Node is out of map bounds
-    if gridIndex[0]<=mapParameters.mapMinX or gridIndex[0]>=mapParameters.mapMaxX or \
-       gridIndex[1]<=mapParameters.mapMinY or gridIndex[1]>=mapParameters.mapMaxY:
-        return False
-
-    # Check if Node is colliding with an obstacle
-    if collision(traj, mapParameters):
-        return False
-    return True
-
-def collision(traj, mapParameters):
+def carFootprint(mapParameters):
 
+    # Offset of the car center from the rear axle, radius of obstacles to check and half length, width of the car with safety margin
     car_length = Car.axleToFront + Car.axleToBack
     carRadius = max(car_length/2, Car.width/2)
     safety_margin = mapParameters.xyResolution
 
     dl = (Car.axleToFront - Car.axleToBack)/2
-    for i in traj:
-        cx = i[0] + dl * math.cos(i[2])
-        cy = i[1] + dl * math.sin(i[2])
-        pointsInObstacle = mapParameters.ObstacleKDTree.query_ball_point([cx, cy], carRadius)
-
-        if not pointsInObstacle:
-            continue
+    return dl, carRadius, car_length/2 + safety_margin, Car.width / 2 + safety_margin
 
-        for p in pointsInObstacle:
-            xo = mapParameters.obstacleX[p] - cx
-            yo = mapParameters.obstacleY[p] - cy
-            dx = xo * math.cos(i[2]) + yo * math.sin(i[2])
-            dy = -xo * math.sin(i[2]) + yo * math.cos(i[2])
-
-            if abs(dx) < car_length/2 + safety_margin and abs(dy) < Car.width / 2 + safety_margin:
-                return True
-
-    return False
+def collision(traj, mapParameters):
+    # The collision kernel takes float64 x, y, yaw rows, float32 pool trajectories and plain lists are converted here
+    return gridCollision(np.ascontiguousarray(traj, dtype=np.float64), mapParameters.obstacleGrid, mapParameters.mapMinX, mapParameters.mapMinY,
+                         mapParameters.xyResolution, *carFootprint(mapParameters))
 
-def reedsSheppCost(currentNode, path):
+def reedsSheppCost(cost, lengths, ctypes):
 
-    # Previos Node Cost
-    cost = currentNode.cost
+    # cost is the previous node cost, lengths and ctypes are those of the Reeds-Shepp path segments
 
     # Distance cost
-    for i in path.lengths:
+    for i in lengths:
         if i >= 0:
             cost += 1
         else:
             cost += abs(i) * Cost.reverse
 
     # Direction change cost
-    for i in range(len(path.lengths)-1):
-        if path.lengths[i] * path.lengths[i+1] < 0:
+    for i in range(len(lengths)-1):
+        if lengths[i] * lengths[i+1] < 0:
             cost += Cost.directionChange
 
     # Steering Angle Cost
-    for i in path.ctypes:
+    for i in ctypes:
         # Check types which are not straight line
         if i!="S":
             cost += Car.maxSteerAngle * Cost.steerAngle
 
     # Steering Angle change cost
-    turnAngle=[0.0 for _ in range(len(path.ctypes))]
-    for i in range(len(path.ctypes)):
-        if path.ctypes[i] == "R":
+    turnAngle=[0.0 for _ in range(len(ctypes))]
+    for i in range(len(ctypes)):
+        if ctypes[i] == "R":
             turnAngle[i] = - Car.maxSteerAngle
-        if path.ctypes[i] == "WB":
+        if ctypes[i] == "WB":
             turnAngle[i] = Car.maxSteerAngle
 
-    for i in range(len(path.lengths)-1):
+    for i in range(len(lengths)-1):
         cost += abs(turnAngle[i+1] - turnAngle[i]) * Cost.steerAngleChange
 
     return cost
 
-def simulatedPathCost(currentNode, motionCommand, simulationLength):
+def holonomicCostsWithObstacles(goal, mapParameters):
 
-    # Previos Node Cost
-    cost = currentNode.cost
-
-    # Distance cost
-    if motionCommand[1] == 1:
-        cost += simulationLength 
-    else:
-        cost += simulationLength * Cost.reverse
-
-    # Direction change cost
-    if currentNode.direction != motionCommand[1]:
-        cost += Cost.directionChange
-
-    # Steering Angle Cost
-    cost += motionCommand[0] * Cost.steerAngle
-
-    # Steering Angle change cost
-    cost += abs(motionCommand[0] - currentNode.steeringAngle) * Cost.steerAngleChange
-
-    return cost
-
-def eucledianCost(holonomicMotionCommand):
-    # Compute Eucledian Distance between two nodes
-    return math.hypot(holonomicMotionCommand[0], holonomicMotionCommand[1])
-
-def holonomicNodeIndex(HolonomicNode):
-    # Index is a tuple consisting grid index, used for checking if two nodes are near/same
-    return tuple([HolonomicNode.gridIndex[0], HolonomicNode.gridIndex[1]])
-
-def obstaclesMap(obstacleX, obstacleY, xyResolution):
-
-    # Compute Grid Index for obstacles
-    obstacleX = [round(x / xyResolution) for x in obstacleX]
-    obstacleY = [round(y / xyResolution) for y in obstacleY]
-
-    # Set all Grid locations to No Obstacle
-    obstacles =[[False for i in range(max(obstacleY))]for i in range(max(obstacleX))]
-
-    # Set Grid Locations with obstacles to True
-    for x in range(max(obstacleX)):
-        for y in range(max(obstacleY)):
-            for i, j in zip(obstacleX, obstacleY):
-                if math.hypot(i-x, j-y) <= 1/2:
-                    obstacles[i][j] = True
-                    break
-
-    return obstacles
-
-def holonomicNodeIsValid(neighbourNode, obstacles, mapParameters):
-
-    # Check if Node is out of map bounds
-    if neighbourNode.gridIndex[0]<= mapParameters.mapMinX or \
-       neighbourNode.gridIndex[0]>= mapParameters.mapMaxX or \
-       neighbourNode.gridIndex[1]<= mapParameters.mapMinY or \
-       neighbourNode.gridIndex[1]>= mapParameters.mapMaxY:
-        return False
-
-    # Check if Node on obstacle
-    if obstacles[neighbourNode.gridIndex[0]][neighbourNode.gridIndex[1]]:
-        return False
-
-    return True
-
-def holonomicCostsWithObstacles(goalNode, mapParameters):
-
-    gridIndex = [round(goalNode.traj[-1][0]/mapParameters.xyResolution), round(goalNode.traj[-1][1]/mapParameters.xyResolution)]
-    gNode = HolonomicNode(gridIndex, 0, tuple(gridIndex))
-
-    obstacles = obstaclesMap(mapParameters.obstacleX, mapParameters.obstacleY, mapParameters.xyResolution)
-
-    holonomicMotionCommand = holonomicMotionCommands()
-
-    openSet = {holonomicNodeIndex(gNode): gNode}
-    closedSet = {}
-
-    priorityQueue =[]
-    heapq.heappush(priorityQueue, (gNode.cost, holonomicNodeIndex(gNode)))
-
-    while True:
-        if not openSet:
-            break
+    # Cost to goal of every x, y grid block for a holonomic robot, indexed from mapMinX, mapMinY (inf if unreachable)
+    goalI = round(goal[0]/mapParameters.xyResolution) - mapParameters.mapMinX
+    goalJ = round(goal[1]/mapParameters.xyResolution) - mapParameters.mapMinY
 
-        _, currentNodeIndex = heapq.heappop(priorityQueue)
-        currentNode = openSet[currentNodeIndex]
-        openSet.pop(currentNodeIndex)
-        closedSet[currentNodeIndex] = currentNode
-
-        for i in range(len(holonomicMotionCommand)):
-            neighbourNode = HolonomicNode([currentNode.gridIndex[0] + holonomicMotionCommand[i][0],\
-                                      currentNode.gridIndex[1] + holonomicMotionCommand[i][1]],\
-                                      currentNode.cost + eucledianCost(holonomicMotionCommand[i]), currentNodeIndex)
-
-            if not holonomicNodeIsValid(neighbourNode, obstacles, mapParameters):
-                continue
-
-            neighbourNodeIndex = holonomicNodeIndex(neighbourNode)
-
-            if neighbourNodeIndex not in closedSet:            
-                if neighbourNodeIndex in openSet:
-                    if neighbourNode.cost < openSet[neighbourNodeIndex].cost:
-                        openSet[neighbourNodeIndex].cost = neighbourNode.cost
-                        openSet[neighbourNodeIndex].parentIndex = neighbourNode.parentIndex
-                        # heapq.heappush(priorityQueue, (neighbourNode.cost, neighbourNodeIndex))
-                else:
-                    openSet[neighbourNodeIndex] = neighbourNode
-                    heapq.heappush(priorityQueue, (neighbourNode.cost, neighbourNodeIndex))
-
-    # Create cost matrix using map bounds
-    x_size = mapParameters.mapMaxX - mapParameters.mapMinX + 1
-    y_size = mapParameters.mapMaxY - mapParameters.mapMinY + 1
-    holonomicCost = [[np.inf for _ in range(y_size)] for _ in range(x_size)]
-
-    for nodes in closedSet.values():
-        holonomicCost[nodes.gridIndex[0]][nodes.gridIndex[1]]=nodes.cost
-
-    return holonomicCost
+    return holonomicDijkstra(mapParameters.obstacleGrid, goalI, goalJ, HOLONOMIC_MOTION_COMMANDS, HOLONOMIC_MOTION_COSTS)
 
 def generate_obstacle_in_grid_map(xy_resolution):
     # Build Map
@@ -366,118 +291,219 @@ def generate_obstacle_in_grid_map(xy_resolution):
 
     return obstacleX, obstacleY
 
-def backtrack(startNode, goalNode, closedSet, plt):
+class SearchTree:
+    # Nodes, open set and closed set of a search rooted at one pose, guided by the holonomic heuristic towards a target pose
+    def __init__(self, root, target, mapParameters, reverseTime=False):
+        self.mapParameters = mapParameters
+        self.nodes = NodePool()
+
+        # A tree grown from the goal (reverseTime) holds trajectories the car drives backwards in time,
+        # so it drives every motion command in the opposite direction
+        self.directionSign = -1 if reverseTime else 1
+
+        # Find Holonomic Heuristric
+        self.holonomicHeuristics = holonomicCostsWithObstacles(target, mapParameters)
+
+        # Open and closed sets as dense grids: best cost and id of the open node in each grid block, and whether the block is closed.
+        # openId keeps the id once the block is closed, so it also gives the closed node of a block
+        self.openCost = np.full(mapParameters.gridShape(), np.inf, dtype=np.float32)
+        self.openId = np.full(mapParameters.gridShape(), -1, dtype=np.int64)
+        self.closedGrid = np.zeros(mapParameters.gridShape(), dtype=np.bool_)
+
+        # Create a priority queue for acquiring nodes based on their cost's
+        # Entries are (cost, tiebreak, cell, id); a node improved later is pushed again and its old entry is skipped on pop
+        self.costQueue = []
+        self.tiebreak = itertools.count()
+
+        # Add root node into open set and priority queue
+        rootGridIndex = mapParameters.gridIndex(root)
+        rootId = self.nodes.add(rootGridIndex, [root], 0, 1, 0, -1)
+        self.rootCell = mapParameters.gridCell(rootGridIndex)
+        self.push(self.rootCell, rootId, 0)
+
+    def reedsSheppInterval(self, cell):
+        # Expansions to wait before the next Reeds-Shepp attempt from cell, scaled by its heuristic relative to the root
+        # A root without a finite heuristic gives no scale, attempt from every node then
+        rootHeuristic = self.holonomicHeuristics[self.rootCell[:2]]
+        if not 0 < rootHeuristic < math.inf:
+            return 0
+        return int(REEDS_SHEPP_INTERVAL * min(self.holonomicHeuristics[cell[:2]] / rootHeuristic, 1.0))
+
+    def push(self, cell, nodeId, cost):
+        self.openCost[cell] = cost
+        self.openId[cell] = nodeId
+        heapq.heappush(self.costQueue, (max(cost , Cost.hybridCost * self.holonomicHeuristics[cell[:2]]), next(self.tiebreak), cell, nodeId))
+
+    def pop(self):
+        # Move the first node in the priority queue to the closed set and return its cell and id, None if the open set is empty
+        while self.costQueue:
+            _, _, cell, nodeId = heapq.heappop(self.costQueue)
+
+            # Skip stale entries
+            if self.closedGrid[cell] or self.openId[cell] != nodeId:
+                continue
+
+            self.closedGrid[cell] = True
+            return cell, nodeId
 
-    # Goal Node data
-    startNodeIndex= index(startNode)
-    currentNodeIndex = goalNode.parentIndex
-    currentNode = closedSet[currentNodeIndex]
-    x = []
-    y = []
-    yaw = []
-    
-    # Iterate till we reach start node from goal node
-    while currentNodeIndex != startNodeIndex:
-        a, b, c = zip(*currentNode.traj)
-        x += a[::-1] 
-        y += b[::-1] 
-        yaw += c[::-1]
-        currentNodeIndex = currentNode.parentIndex
-        currentNode = closedSet[currentNodeIndex]
+        return None
 
-    return x[::-1], y[::-1], yaw[::-1]
+    def expand(self, currentId, plt):
+        # Look up everything the successor loop needs once, not per successor
+        nodes, gridCell, closedGrid, openCost = self.nodes, self.mapParameters.gridCell, self.closedGrid, self.openCost
+        currentCost, currentDirection, currentSteeringAngle = nodes.cost[currentId], nodes.direction[currentId], nodes.steeringAngle[currentId]
+        reverse, directionChange, steerAngle, steerAngleChange = Cost.reverse, Cost.directionChange, Cost.steerAngle, Cost.steerAngleChange
+        directionSign = self.directionSign
 
-def run(s, g, mapParameters, plt):
+        # Get all simulated Nodes from current node, only those within map bounds and collision free are considered
+        trajs, gridIndices, valid = expandNode(nodes, currentId, self.mapParameters)
+        for i in np.flatnonzero(valid):
+            gridIndex, traj = gridIndices[i], trajs[i]
+            steeringAngle, direction = MOTION_COMMANDS[i]
+            direction *= directionSign
 
-    # Compute Grid Index for start and Goal node
-    sGridIndex = [round(s[0] / mapParameters.xyResolution), \
-                  round(s[1] / mapParameters.xyResolution), \
-                  round(s[2]/mapParameters.yawResolution)]
-    gGridIndex = [round(g[0] / mapParameters.xyResolution), \
-                  round(g[1] / mapParameters.xyResolution), \
-                  round(g[2]/mapParameters.yawResolution)]
+            # Calculate Cost of the node
+            cost = simulatedPathCost(currentCost, currentDirection, currentSteeringAngle, steeringAngle, direction, SIMULATION_LENGTH,
+                                     reverse, directionChange, steerAngle, steerAngleChange)
 
-    # Generate all Possible motion commands to car
-    motionCommand = motionCommands()
+            # Draw Simulated Node
+            plt.plot(traj[:, 0], traj[:, 1], linewidth=0.3, color='g')
 
-    # Create start and end Node
-    startNode = Node(sGridIndex, [s], 0, 1, 0 , tuple(sGridIndex))
-    goalNode = Node(gGridIndex, [g], 0, 1, 0, tuple(gGridIndex))
+            # Check if simulated node is already in closed set
+            simulatedCell = gridCell(gridIndex)
+            if not closedGrid[simulatedCell]:
 
-    # Find Holonomic Heuristric
-    holonomicHeuristics = holonomicCostsWithObstacles(goalNode, mapParameters)
+                # Check if simulated node is new or cheaper than the open one (inf when not open), if so add it open set as well as in priority queue
+                if cost < openCost[simulatedCell]:
+                    simulatedId = nodes.add(gridIndex, traj, steeringAngle, direction, cost, currentId)
+                    self.push(simulatedCell, simulatedId, cost)
 
-    # Add start node to open Set
-    openSet = {index(startNode):startNode}
-    closedSet = {}
+def backtrack(nodes, goalId):
 
-    # Create a priority queue for acquiring nodes based on their cost's
-    costQueue = heapdict()
+    # Collect node ids by following parent ids from goal node to start node (start pose excluded)
+    nodeIds = []
+    currentId = goalId
 
-    # Add start mode into priority queue
-    costQueue[index(startNode)] = max(startNode.cost , Cost.hybridCost * holonomicHeuristics[startNode.gridIndex[0]][startNode.gridIndex[1]])
-    counter = 0
+    # Iterate till we reach start node from goal node
+    while nodes.parent[currentId] != -1:
+        nodeIds.append(currentId)
+        currentId = nodes.parent[currentId]
 
-    # Run loop while path is found or open set is empty
-    while True:
-        counter +=1
-        # Check if openSet is empty, if empty no solution available
-        if not openSet:
-            return None
+    # Copy the trajectory rows of those nodes out of the pool into one array, filling it back to front
+    path = np.empty((nodes.trajLength[nodeIds].sum(), 3), dtype=nodes.traj.dtype)
+    end = len(path)
+    for nodeId in nodeIds:
+        start = end - nodes.trajLength[nodeId]
+        path[start:end] = nodes.trajectory(nodeId)
+        end = start
+
+    return path[:, 0].tolist(), path[:, 1].tolist(), path[:, 2].tolist()
 
-        # Get first node in the priority queue
-        currentNodeIndex = costQueue.popitem()[0]
-        currentNode = openSet[currentNodeIndex]
+def run(s, g, mapParameters, plt):
 
-        # Revove currentNode from openSet and add it to closedSet
-        openSet.pop(currentNodeIndex)
-        closedSet[currentNodeIndex] = currentNode
+    # Compute Grid Index for Goal node
+    gGridIndex = mapParameters.gridIndex(g)
+    goalCell = mapParameters.gridCell(gGridIndex)
 
+    # Search from the start node
+    tree = SearchTree(s, g, mapParameters)
 
-        # Get Reed-Shepp Node if available
-        rSNode = reedsSheppNode(currentNode, goalNode, mapParameters)
+    # Expansions since the last Reeds-Shepp attempt, the start node gets one right away
+    sinceReedsShepp = math.inf
 
-        # Id Reeds-Shepp Path is found exit
-        if rSNode:
-            closedSet[index(rSNode)] = rSNode
-            break
+    # Run loop while path is found or open set is empty
+    while True:
+        # Get first node in the priority queue, if open set is empty no solution available
+        current = tree.pop()
+        if current is None:
+            return None
+        currentCell, currentId = current
+
+        # Get Reed-Shepp Node if available, attempted more often the closer the node is to the goal
+        sinceReedsShepp += 1
+        if sinceReedsShepp > tree.reedsSheppInterval(currentCell):
+            sinceReedsShepp = 0
+            goalId = reedsSheppNode(tree.nodes, currentId, g, gGridIndex, mapParameters)
+
+            # Id Reeds-Shepp Path is found exit
+            if goalId is not None:
+                break
 
         # USED ONLY WHEN WE DONT USE REEDS-SHEPP EXPANSION OR WHEN START = GOAL
-        if currentNodeIndex == index(goalNode):
+        if currentCell == goalCell:
             print("Path Found")
-            print(currentNode.traj[-1])
+            print(tree.nodes.pose(currentId))
+            goalId = currentId
             break
 
-        # Get all simulated Nodes from current node
-        for i in range(len(motionCommand)):
-            simulatedNode = kinematicSimulationNode(currentNode, motionCommand[i], mapParameters)
-
-            # Check if path is within map bounds and is collision free
-            if not simulatedNode:
-                continue
-
-            # Draw Simulated Node
-            x,y,z =zip(*simulatedNode.traj)
-            plt.plot(x, y, linewidth=0.3, color='g')
+        tree.expand(currentId, plt)
 
-            # Check if simulated node is already in closed set
-            simulatedNodeIndex = index(simulatedNode)
-            if simulatedNodeIndex not in closedSet: 
-
-                # Check if simulated node is already in open set, if not add it open set as well as in priority queue
-                if simulatedNodeIndex not in openSet:
-                    openSet[simulatedNodeIndex] = simulatedNode
-                    costQueue[simulatedNodeIndex] = max(simulatedNode.cost , Cost.hybridCost * holonomicHeuristics[simulatedNode.gridIndex[0]][simulatedNode.gridIndex[1]])
-                else:
-                    if simulatedNode.cost < openSet[simulatedNodeIndex].cost:
-                        openSet[simulatedNodeIndex] = simulatedNode
-                        costQueue[simulatedNodeIndex] = max(simulatedNode.cost , Cost.hybridCost * holonomicHeuristics[simulatedNode.gridIndex[0]][simulatedNode.gridIndex[1]])
-    
     # Backtrack
-    x, y, yaw = backtrack(startNode, goalNode, closedSet, plt)
+    x, y, yaw = backtrack(tree.nodes, goalId)
 
     return x, y, yaw
 
+def runBidirectional(s, g, mapParameters, plt):
+
+    # Same as run, but a second search grows from the goal while the first grows from the start, one expansion each in turn.
+    # The trajectories of the goal side are geometric curves, the car drives them backwards in time, so that search
+    # costs them with the direction the car actually drives.
+    # When a closed grid block is reached by both searches, the two nodes are joined with a Reeds-Shepp path
+    gGridIndex = mapParameters.gridIndex(g)
+    forward = SearchTree(s, g, mapParameters)
+    backward = SearchTree(g, s, mapParameters, reverseTime=True)
+
+    # Expansions since the last Reeds-Shepp attempt to goal, the start node gets one right away
+    sinceReedsShepp = math.inf
+
+    while True:
+        # Forward step: Reeds-Shepp to goal as often as run attempts it, or to the backward node closed in the same grid block
+        current = forward.pop()
+        if current is None:
+            return None
+        currentCell, forwardId = current
+
+        sinceReedsShepp += 1
+        if sinceReedsShepp > forward.reedsSheppInterval(currentCell):
+            sinceReedsShepp = 0
+            goalId = reedsSheppNode(forward.nodes, forwardId, g, gGridIndex, mapParameters)
+            if goalId is not None:
+                return backtrack(forward.nodes, goalId)
+
+        if backward.closedGrid[currentCell]:
+            path = joinTrees(forward, forwardId, backward, backward.openId[currentCell], g, mapParameters)
+            if path:
+                return path
+
+        forward.expand(forwardId, plt)
+
+        # Backward step: Reeds-Shepp from the forward node closed in the same grid block.
+        # An exhausted backward search does not make the goal unreachable, the forward search then continues alone
+        current = backward.pop()
+        if current is None:
+            continue
+        currentCell, backwardId = current
+
+        if forward.closedGrid[currentCell]:
+            path = joinTrees(forward, forward.openId[currentCell], backward, backwardId, g, mapParameters)
+            if path:
+                return path
+
+        backward.expand(backwardId, plt)
+
+def joinTrees(forward, forwardId, backward, backwardId, g, mapParameters):
+
+    # Path from start over forwardId, a Reeds-Shepp path to backwardId and the backward nodes to goal, None if the Reeds-Shepp path collides
+    meetId = reedsSheppNode(forward.nodes, forwardId, backward.nodes.pose(backwardId), backward.nodes.gridIndex[backwardId], mapParameters)
+    if meetId is None:
+        return None
+
+    x, y, yaw = backtrack(forward.nodes, meetId)
+    bx, by, byaw = backtrack(backward.nodes, backwardId)
+
+    # The backward nodes from backwardId to goal start with the meeting pose, which already ends the forward path
+    return x + (bx[::-1] + [g[0]])[1:], y + (by[::-1] + [g[1]])[1:], yaw + (byaw[::-1] + [g[2]])[1:]
+
 def drawCar(x, y, yaw, color='black'):
     car = np.array([[-Car.axleToBack, -Car.axleToBack, Car.axleToFront, Car.axleToFront, -Car.axleToBack],
                     [Car.width / 2, -Car.width / 2, -Car.width / 2, Car.width / 2, Car.width / 2]])
@@ -0,0 +1,226 @@
+# Numba kernels used by hybrid_a_star.py. Running this file compiles them ahead of
+# time into the hybrid_a_star_aot extension next to it, so the search starts without
+# paying the JIT warm-up; without that extension the kernels are JIT compiled on first use.
+
+import os
+import math
+import numpy as np
+from numba import njit, prange
+
+@njit(cache=True)
+def piToPi(theta):
+    # Same wrapping as rsCurve.pi_2_pi, compiled for use inside the rollout
+    while theta > math.pi:
+        theta -= 2.0 * math.pi
+
+    while theta < -math.pi:
+        theta += 2.0 * math.pi
+
+    return theta
+
+@njit(cache=True, fastmath=True)
+def rollout(x, y, yaw, step, dYaw, traj):
+
+    # Integrate the bicycle model from (x, y, yaw) and fill traj with one x, y, yaw row per step.
+    # step is the signed distance of one step and dYaw its heading change (see MOTION_STEPS, MOTION_YAW_STEPS)
+    yaw = piToPi(yaw + dYaw)
+    for i in range(traj.shape[0]):
+        x += step * math.cos(yaw)
+        y += step * math.sin(yaw)
+        yaw = piToPi(yaw + dYaw)
+        traj[i, 0] = x
+        traj[i, 1] = y
+        traj[i, 2] = yaw
+
+    return traj
+
+@njit(cache=True, parallel=True)
+def expandAll(x, y, yaw, steps, yawSteps, trajs):
+
+    # Roll out every motion command from the same pose, trajs[i] receives the trajectory of command i
+    for i in prange(steps.shape[0]):
+        rollout(x, y, yaw, steps[i], yawSteps[i], trajs[i])
+
+    return trajs
+
+@njit(cache=True, parallel=True)
+def checkAll(trajs, obstacleGrid, mapMinX, mapMinY, mapMaxX, mapMaxY, xyResolution, yawResolution,
+             dl, carRadius, halfLength, halfWidth, gridIndices, valid):
+
+    # Find grid index of every trajectory end and check if it is out of map bounds or colliding with an obstacle
+    for i in prange(trajs.shape[0]):
+        gridIndices[i, 0] = np.rint(trajs[i, -1, 0] / xyResolution)
+        gridIndices[i, 1] = np.rint(trajs[i, -1, 1] / xyResolution)
+        gridIndices[i, 2] = np.rint(trajs[i, -1, 2] / yawResolution)
+
+        if gridIndices[i, 0] <= mapMinX or gridIndices[i, 0] >= mapMaxX or \
+           gridIndices[i, 1] <= mapMinY or gridIndices[i, 1] >= mapMaxY:
+            valid[i] = False
+        else:
+            valid[i] = not gridCollision(trajs[i], obstacleGrid, mapMinX, mapMinY, xyResolution, dl, carRadius, halfLength, halfWidth)
+
+    return valid
+
+@njit(cache=True)
+def gridCollision(traj, obstacleGrid, mapMinX, mapMinY, xyResolution, dl, carRadius, halfLength, halfWidth):
+
+    # For every trajectory pose, scan the occupied grid blocks within carRadius of the car center
+    # and check whether the obstacle lies inside the car rectangle (with safety margin)
+    for k in range(traj.shape[0]):
+        cosYaw = math.cos(traj[k, 2])
+        sinYaw = math.sin(traj[k, 2])
+        cx = traj[k, 0] + dl * cosYaw
+        cy = traj[k, 1] + dl * sinYaw
+
+        minI = max(math.floor((cx - carRadius) / xyResolution) - mapMinX, 0)
+        maxI = min(math.ceil((cx + carRadius) / xyResolution) - mapMinX, obstacleGrid.shape[0] - 1)
+        minJ = max(math.floor((cy - carRadius) / xyResolution) - mapMinY, 0)
+        maxJ = min(math.ceil((cy + carRadius) / xyResolution) - mapMinY, obstacleGrid.shape[1] - 1)
+
+        for i in range(minI, maxI + 1):
+            for j in range(minJ, maxJ + 1):
+                if not obstacleGrid[i, j]:
+                    continue
+
+                xo = (i + mapMinX) * xyResolution - cx
+                yo = (j + mapMinY) * xyResolution - cy
+                if xo * xo + yo * yo > carRadius * carRadius:
+                    continue
+
+                dx = xo * cosYaw + yo * sinYaw
+                dy = -xo * sinYaw + yo * cosYaw
+
+                if abs(dx) < halfLength and abs(dy) < halfWidth:
+                    return True
+
+    return False
+
+@njit(cache=True)
+def simulatedPathCost(cost, direction, steeringAngle, newSteeringAngle, newDirection, simulationLength,
+                      reverse, directionChange, steerAngle, steerAngleChange):
+
+    # cost, direction and steeringAngle are those of the previous node, the new ones come from the motion command
+
+    # Distance cost
+    if newDirection == 1:
+        cost += simulationLength
+    else:
+        cost += simulationLength * reverse
+
+    # Direction change cost
+    if direction != newDirection:
+        cost += directionChange
+
+    # Steering Angle Cost, left and right turns are penalised alike
+    cost += abs(newSteeringAngle) * steerAngle
+
+    # Steering Angle change cost
+    cost += abs(newSteeringAngle - steeringAngle) * steerAngleChange
+
+    return cost
+
+@njit(cache=True)
+def holonomicDijkstra(obstacleGrid, goalI, goalJ, motionCommands, motionCosts):
+
+    # Dijkstra from the goal block over the free blocks inside the map bounds.
+    # The priority queue is a binary heap kept in two arrays, stale entries are skipped on pop
+    xSize, ySize = obstacleGrid.shape
+    holonomicCost = np.full((xSize, ySize), np.inf, dtype=np.float32)
+    closed = np.zeros((xSize, ySize), dtype=np.bool_)
+
+    heapCost = np.empty(len(motionCommands) * xSize * ySize + 1, dtype=np.float32)
+    heapIndex = np.empty(len(motionCommands) * xSize * ySize + 1, dtype=np.int64)
+
+    holonomicCost[goalI, goalJ] = 0
+    size = heapPush(heapCost, heapIndex, 0, 0.0, goalI * ySize + goalJ)
+
+    while size > 0:
+        cost, index, size = heapPop(heapCost, heapIndex, size)
+        i, j = index // ySize, index % ySize
+
+        if closed[i, j]:
+            continue
+        closed[i, j] = True
+
+        for k in range(len(motionCommands)):
+            ni = i + motionCommands[k, 0]
+            nj = j + motionCommands[k, 1]
+
+            # Check if neighbour is out of map bounds or on obstacle
+            if ni <= 0 or ni >= xSize - 1 or nj <= 0 or nj >= ySize - 1:
+                continue
+            if obstacleGrid[ni, nj] or closed[ni, nj]:
+                continue
+
+            neighbourCost = cost + motionCosts[k]
+            if neighbourCost < holonomicCost[ni, nj]:
+                holonomicCost[ni, nj] = neighbourCost
+                size = heapPush(heapCost, heapIndex, size, neighbourCost, ni * ySize + nj)
+
+    return holonomicCost
+
+@njit(cache=True)
+def heapPush(heapCost, heapIndex, size, cost, index):
+    # Sift a new entry up from the end of the heap, return the new heap size
+    i = size
+    while i > 0:
+        parent = (i - 1) // 2
+        if heapCost[parent] <= cost:
+            break
+        heapCost[i] = heapCost[parent]
+        heapIndex[i] = heapIndex[parent]
+        i = parent
+
+    heapCost[i] = cost
+    heapIndex[i] = index
+
+    return size + 1
+
+@njit(cache=True)
+def heapPop(heapCost, heapIndex, size):
+    # Remove the cheapest entry and sift the last entry down into its place, return the entry and the new heap size
+    cost, index = heapCost[0], heapIndex[0]
+
+    size -= 1
+    lastCost, lastIndex = heapCost[size], heapIndex[size]
+
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and heapCost[child + 1] < heapCost[child]:
+            child += 1
+        if heapCost[child] >= lastCost:
+            break
+        heapCost[i] = heapCost[child]
+        heapIndex[i] = heapIndex[child]
+        i = child
+
+    heapCost[i] = lastCost
+    heapIndex[i] = lastIndex
+
+    return cost, index, size
+
+
+def compileAheadOfTime():
+
+    # pycc compiles each kernel for exactly the argument types listed here. Unlike the JIT
+    # dispatcher the exported functions do not check array dtypes, a mismatch crashes the
+    # process, so hybrid_a_star.py converts every array to these types before the call
+    # (MapParameters, collision, the motion and holonomic tables). prange loops run serially in this build
+    from numba.pycc import CC
+
+    cc = CC('hybrid_a_star_aot')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+    cc.export('expandAll', 'f4[:,:,:](f8, f8, f8, f8[:], f8[:], f4[:,:,:])')(expandAll.py_func)
+    cc.export('checkAll', 'b1[:](f4[:,:,:], u1[:,:], i8, i8, i8, i8, f8, f8, f8, f8, f8, f8, i8[:,:], b1[:])')(checkAll.py_func)
+    cc.export('gridCollision', 'b1(f8[:,:], u1[:,:], i8, i8, f8, f8, f8, f8, f8)')(gridCollision.py_func)
+    cc.export('simulatedPathCost', 'f8(f8, f8, f8, f8, f8, f8, f8, f8, f8, f8)')(simulatedPathCost.py_func)
+    cc.export('holonomicDijkstra', 'f4[:,:](u1[:,:], i8, i8, i8[:,:], f4[:])')(holonomicDijkstra.py_func)
+
+    cc.compile()
+
+if __name__ == '__main__':
+    compileAheadOfTime()
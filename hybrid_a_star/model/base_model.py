@@ -24,6 +24,10 @@ class BaseModel(ABC):
         self.nx = params["num_states"]
         ## Number of inputs
         self.nu = params["num_inputs"] 
+        ## Cache of compiled integrator functions keyed by (step_size, method)
+        self._step_functions = {}
+        ## Cache of trajectory rollout functions keyed by (step_size, method, number of steps)
+        self._rollout_functions = {}
         
     @abstractmethod
     def dynamics(self, state: Union[casadi.SX, casadi.DM], input: Union[casadi.SX, casadi.DM]) -> Union[casadi.SX, casadi.DM]:
@@ -44,6 +48,8 @@ class BaseModel(ABC):
         @brief Advances the state of the system using a numerical integration method.
 
         This function integrates the system's equations using various discrete methods.
+        Numeric (DM) states are integrated with a cached, JIT compiled function while symbolic (SX)
+        states are integrated inline so that the expression graph can be embedded in larger problems.
 
         @param[in] state A CasADi SX or DM variable representing the current state of the system.
         @param[in] input A CasADi SX or DM variable representing the control input to the system.
@@ -53,10 +59,96 @@ class BaseModel(ABC):
                   - "RK4" (Runge-Kutta 4th order)
 
         @throws Exception If the specified integration method is not supported.
+        @throws Exception If the size of the state or input is not matched with the model.
 
         @return Union[casadi.SX, casadi.DM] A CasADi SX or DM variable representing the state of the system at the next time step.
         """
+        if state.size() != (self.nx, 1):
+            raise Exception(f"Failed to step the model. The size of state {state.size()} is not matched with the required size ({self.nx}, 1)")
         
+        if input.size() != (self.nu, 1):
+            raise Exception(f"Failed to step the model. The size of input {input.size()} is not matched with the required size ({self.nu}, 1)")
+        
+        if isinstance(state, casadi.DM):
+            return self._step_function(step_size, method)(state, input)
+
+        return self._integrate(state, input, step_size, method)
+
+    def rollout(self, state: Union[casadi.SX, casadi.DM], input_sequence: Union[casadi.SX, casadi.DM], step_size: float, method: str = "RK4") -> Union[casadi.SX, casadi.DM]:
+        """!
+        @brief Rolls out the state trajectory of the system for a sequence of control inputs.
+
+        The whole horizon is evaluated by a single CasADi function built with `mapaccum` from the
+        cached step function, instead of calling `step` once per time step.
+
+        @param[in] state A CasADi SX or DM variable representing the initial state of the system.
+        @param[in] input_sequence A CasADi SX or DM matrix of size (nu, N) with the control input of each time step.
+        @param[in] step_size The step size for numerical integration.
+        @param[in] method The integration method to use ("RK1" or "RK4").
+
+        @throws Exception If the size of the state or input sequence is not matched with the model.
+
+        @return Union[casadi.SX, casadi.DM] A CasADi SX or DM matrix of size (nx, N) with the states after each time step,
+                which can be passed to e.g. `get_full_state_trajectory`.
+        """
+        if state.size() != (self.nx, 1):
+            raise Exception(f"Failed to roll out the model. The size of state {state.size()} is not matched with the required size ({self.nx}, 1)")
+        
+        if input_sequence.size1() != self.nu:
+            raise Exception(f"Failed to roll out the model. The size of input sequence {input_sequence.size()} is not matched with the required size ({self.nu}, N)")
+        
+        key = (step_size, method, input_sequence.size2())
+        
+        if key not in self._rollout_functions:
+            self._rollout_functions[key] = self._step_function(step_size, method).mapaccum(input_sequence.size2())
+            
+        return self._rollout_functions[key](state, input_sequence)
+
+    def _step_function(self, step_size: float, method: str = "RK4") -> casadi.Function:
+        """!
+        @brief Gets the compiled integrator function for a given step size and method.
+
+        The integrator graph is built once per (step_size, method) and JIT compiled. All stages of the
+        method are fused into a single function so that common subexpression elimination can share
+        terms (e.g. trigonometric functions of the state) between stages. If the JIT compilation fails
+        (e.g. no C compiler is available), a non-JIT function is used instead.
+
+        @param[in] step_size The step size for numerical integration.
+        @param[in] method The integration method to use ("RK1" or "RK4").
+
+        @return casadi.Function A CasADi function mapping (state, input) to the state at the next time step.
+        """
+        key = (step_size, method)
+        
+        if key not in self._step_functions:
+            state = cs.SX.sym("x", self.nx)
+            input = cs.SX.sym("u", self.nu)
+            state_next = self._integrate(state, input, step_size, method)
+            
+            try:
+                function = cs.Function("step", [state, input], [state_next],
+                                       {"cse": True, "jit": True, "compiler": "shell", "jit_options": {"flags": ["-O3"]}})
+            except Exception as e:
+                print(f"JIT compilation of the step function failed, falling back to the CasADi virtual machine: {e}")
+                function = cs.Function("step", [state, input], [state_next], {"cse": True})
+                
+            self._step_functions[key] = function
+            
+        return self._step_functions[key]
+
+    def _integrate(self, state: Union[casadi.SX, casadi.DM], input: Union[casadi.SX, casadi.DM], step_size: float, method: str = "RK4") -> Union[casadi.SX, casadi.DM]:
+        """!
+        @brief Builds the integration expression of the system for one time step.
+
+        @param[in] state A CasADi SX or DM variable representing the current state of the system.
+        @param[in] input A CasADi SX or DM variable representing the control input to the system.
+        @param[in] step_size The step size for numerical integration.
+        @param[in] method The integration method to use ("RK1" or "RK4").
+
+        @throws Exception If the specified integration method is not supported.
+
+        @return Union[casadi.SX, casadi.DM] A CasADi SX or DM variable representing the state of the system at the next time step.
+        """
         if method == "RK1":
             state_dot = self.dynamics(state, input)
             state += step_size * state_dot
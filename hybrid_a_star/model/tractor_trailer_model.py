@@ -2,6 +2,9 @@ from model.base_model import BaseModel
 import casadi as cs
 import casadi  # only for type hinting
 from typing import Union
+import hashlib
+import os
+import subprocess
 
 class TractorTrailerModel(BaseModel):
     """!
@@ -18,6 +21,7 @@ class TractorTrailerModel(BaseModel):
                          - "length_back" (float): Length from the center of the tractor to the hitching point.
                          - "length_front" (float): Length from the center of the trailer to the hitching point.
                          - "trailer_based_model" (bool): Flag to determine the model configuration. True if the model is trailer-based, False otherwise.
+                         - "codegen_directory" (str): Directory of the generated C code and compiled dynamics. Default is ~/.cache/hybrid_a_star.
         """
         super().__init__(params)
 
@@ -36,6 +40,28 @@ class TractorTrailerModel(BaseModel):
             print(f"Tractor-Trailer Model is trailer-based")
         else:
             print(f"Tractor-Trailer Model is tractor-based")
+        
+        ## Pose transformation between tractor and trailer, evaluated column-wise on state trajectories
+        self._pose_function = None
+        
+        if self.nx == 4:
+            state = cs.SX.sym("x", self.nx)
+            
+            if self._trailer_based_model:
+                self._pose_function = cs.Function("tractor_pose", [state], [self.compute_tractor_pose_from_trailer_pose(state)])
+            else:
+                self._pose_function = cs.Function("trailer_pose", [state], [self.compute_trailer_pose_from_tractor_pose(state)])
+        
+        ## Cache of the pose transformation mapped over trajectories, keyed by the number of columns
+        self._pose_function_maps = {}
+        
+        ## Directory of the generated C code and compiled dynamics
+        self._codegen_directory = params.get("codegen_directory", os.path.join(os.path.expanduser("~"), ".cache", "hybrid_a_star"))
+        
+        ## Compiled dynamics used for numeric (DM) evaluation, built from the symbolic dynamics below
+        self._dynamics_function = None
+        
+        self._dynamics_function = self._load_dynamics_function()
     
     def dynamics(self, state: Union[casadi.SX, casadi.DM], input: Union[casadi.SX, casadi.DM]) -> Union[casadi.SX, casadi.DM]:
         """!
@@ -46,20 +72,25 @@ class TractorTrailerModel(BaseModel):
         
         @return Union[casadi.SX, casadi.DM] A CasADi SX or DM variable representing the time derivative of the state.
         """
-        if state.size() != (self.nx, 1):
-            raise Exception(f"Failed to compute dynamics. The size of state {state.size()} is not matched with the required size ({self.nx}, 1)")
+        # Sizes are checked once per step in BaseModel.step, these checks are stripped with python -O
+        if __debug__:
+            if state.size() != (self.nx, 1):
+                raise Exception(f"Failed to compute dynamics. The size of state {state.size()} is not matched with the required size ({self.nx}, 1)")
+            
+            if input.size() != (self.nu, 1):
+                raise Exception(f"Failed to compute dynamics. The size of input {input.size()} is not matched with the required size ({self.nu}, 1)")
         
-        if input.size() != (self.nu, 1):
-            raise Exception(f"Failed to compute dynamics. The size of input {input.size()} is not matched with the required size ({self.nu}, 1)")
+        if self._dynamics_function is not None and isinstance(state, casadi.DM):
+            return self._dynamics_function(state, input)
         
         v1 = input[0]
         
         w1 = input[1]
         
-        state_dot = []
-        
         if state.size1() == 6:
-            x1, y1, theta1, x2, y2, theta2 = cs.vertsplit(state)
+            theta1 = state[2]
+            
+            theta2 = state[5]
             
             gamma = theta2 - theta1
             
@@ -75,10 +106,12 @@ class TractorTrailerModel(BaseModel):
             
             theta2_dot = - v1 * (1 / self._lf) * cs.sin(gamma) - w1 * (self._lb / self._lf) * cs.cos(gamma)
             
-            state_dot = [x1_dot, y1_dot, theta1_dot, x2_dot, y2_dot, theta2_dot]         
+            return cs.vertcat(x1_dot, y1_dot, theta1_dot, x2_dot, y2_dot, theta2_dot)
             
         elif state.size1() == 4 and self._trailer_based_model:
-            x2, y2, theta2, gamma = cs.vertsplit(state)
+            theta2 = state[2]
+            
+            gamma = state[3]
             
             x2_dot = v1 * cs.cos(theta2) * cs.cos(gamma) - w1 * self._lb * cs.cos(theta2) * cs.sin(gamma)
             
@@ -88,10 +121,12 @@ class TractorTrailerModel(BaseModel):
             
             gamma_dot = - v1 * (1 / self._lf) * cs.sin(gamma) - w1 * ((self._lb / self._lf) * cs.cos(gamma) + 1)
             
-            state_dot = [x2_dot, y2_dot, theta2_dot, gamma_dot]
+            return cs.vertcat(x2_dot, y2_dot, theta2_dot, gamma_dot)
             
         elif state.size1() == 4 and not self._trailer_based_model:
-            x1, y1, theta1, gamma = cs.vertsplit(state)
+            theta1 = state[2]
+            
+            gamma = state[3]
             
             x1_dot = v1 * cs.cos(theta1)
             
@@ -101,9 +136,9 @@ class TractorTrailerModel(BaseModel):
             
             gamma_dot = - v1 * (1 / self._lf) * cs.sin(gamma) - w1 * ((self._lb / self._lf) * cs.cos(gamma) + 1)
             
-            state_dot = [x1_dot, y1_dot, theta1_dot, gamma_dot]
+            return cs.vertcat(x1_dot, y1_dot, theta1_dot, gamma_dot)
         
-        return cs.vertcat(*state_dot)
+        return cs.vertcat()
 
     def compute_tractor_pose_from_trailer_pose(self, state: Union[casadi.SX, casadi.DM]) -> Union[casadi.SX, casadi.DM]:
         """!
@@ -116,7 +151,13 @@ class TractorTrailerModel(BaseModel):
         if state.size() != (self.nx, 1):
             raise Exception(f"Failed to compute tractor pose. The size of input argument {state.size()} is not matched with the size of state ({self.nx}, 1)")
 
-        x2, y2, theta2, gamma = cs.vertsplit(state)
+        x2 = state[0]
+        
+        y2 = state[1]
+        
+        theta2 = state[2]
+        
+        gamma = state[3]
         
         theta1 = theta2 - gamma
         
@@ -137,7 +178,13 @@ class TractorTrailerModel(BaseModel):
         if state.size() != (self.nx, 1):
             raise Exception(f"Failed to compute trailer pose. The size of input argument {state.size()} is not matched with the size of state ({self.nx}, 1)")
         
-        x1, y1, theta1, gamma = cs.vertsplit(state)
+        x1 = state[0]
+        
+        y1 = state[1]
+        
+        theta1 = state[2]
+        
+        gamma = state[3]
         
         theta2 = theta1 + gamma
         
@@ -167,12 +214,68 @@ class TractorTrailerModel(BaseModel):
         
         elif state_trajectory.shape[0] == 4 and self._trailer_based_model == False:
             full_state_trajectory[0:3, :] = state_trajectory[0:3, :] # tractor state    
-            for i in range(state_trajectory.shape[1]):
-                full_state_trajectory[3:6, i] = self.compute_trailer_pose_from_tractor_pose(state_trajectory[:, i])
+            full_state_trajectory[3:6, :] = self._map_pose_function(state_trajectory.shape[1])(state_trajectory)
                 
         elif state_trajectory.shape[0] == 4 and self._trailer_based_model == True:
             full_state_trajectory[3:6, :] = state_trajectory[0:3, :] # trailer state
-            for i in range(state_trajectory.shape[1]):
-                full_state_trajectory[0:3, i] = self.compute_tractor_pose_from_trailer_pose(state_trajectory[:, i])
+            full_state_trajectory[0:3, :] = self._map_pose_function(state_trajectory.shape[1])(state_trajectory)
+            
+        return full_state_trajectory
+
+    def _map_pose_function(self, num_columns: int) -> casadi.Function:
+        """!
+        @brief Gets the pose transformation mapped over a trajectory with a given number of columns.
+
+        @param[in] num_columns The number of columns (time steps) of the state trajectory.
+
+        @return casadi.Function A CasADi function computing the other body's pose for every column of a trajectory in a single call.
+        """
+        if num_columns not in self._pose_function_maps:
+            self._pose_function_maps[num_columns] = self._pose_function.map(num_columns, "thread")
             
-        return full_state_trajectory
\ No newline at end of file
+        return self._pose_function_maps[num_columns]
+
+    def _load_dynamics_function(self) -> casadi.Function:
+        """!
+        @brief Loads the dynamics compiled into a shared library, generating and compiling it first if needed.
+
+        The library is named after a hash of the model configuration, so it is only generated and compiled 
+        once per configuration and later instances load it directly without any compilation latency.
+        If the code generation or compilation fails, the dynamics are wrapped in a non-compiled CasADi function.
+
+        @return casadi.Function A CasADi function mapping (state, input) to the time derivative of the state.
+        """
+        name = "tractor_trailer_dynamics"
+        
+        configuration = (self._lb, self._lf, self._trailer_based_model, self.nx, self.nu, cs.__version__)
+        
+        basename = f"{name}_{hashlib.md5(repr(configuration).encode()).hexdigest()}"
+        
+        library = os.path.join(self._codegen_directory, basename + ".so")
+        
+        state = cs.SX.sym("x", self.nx)
+        
+        input = cs.SX.sym("u", self.nu)
+        
+        function = cs.Function(name, [state, input], [self.dynamics(state, input)])
+        
+        try:
+            if not os.path.exists(library):
+                os.makedirs(self._codegen_directory, exist_ok=True)
+                
+                generator = cs.CodeGenerator(basename + ".c")
+                
+                generator.add(function)
+                
+                source = generator.generate(self._codegen_directory + os.sep)
+                
+                # Compile to a process-unique name first so concurrent instances never load a partially written library
+                subprocess.run(["gcc", "-O3", "-shared", "-fPIC", source, "-o", f"{library}.{os.getpid()}"], check=True)
+                
+                os.replace(f"{library}.{os.getpid()}", library)
+                
+            return cs.external(name, library)
+        
+        except Exception as e:
+            print(f"Failed to load the compiled dynamics, falling back to the CasADi virtual machine: {e}")
+            return function
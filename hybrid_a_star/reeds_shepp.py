@@ -41,21 +41,28 @@ def calc_all_paths(sx, sy, syaw, gx, gy, gyaw, maxc, step_size=STEP_SIZE):
     paths = generate_path(q0, q1, maxc)
 
     for path in paths:
-        x, y, yaw, directions = \
-            generate_local_course(path.L, path.lengths,
-                                  path.ctypes, maxc, step_size * maxc)
-
-        # convert global coordinate
-        path.x = [math.cos(-q0[2]) * ix + math.sin(-q0[2]) * iy + q0[0] for (ix, iy) in zip(x, y)]
-        path.y = [-math.sin(-q0[2]) * ix + math.cos(-q0[2]) * iy + q0[1] for (ix, iy) in zip(x, y)]
-        path.yaw = [pi_2_pi(iyaw + q0[2]) for iyaw in yaw]
-        path.directions = directions
-        path.lengths = [l / maxc for l in path.lengths]
-        path.L = path.L / maxc
+        calc_path_course(path, sx, sy, syaw, maxc, step_size)
 
     return paths
 
 
+def calc_path_course(path, sx, sy, syaw, maxc, step_size=STEP_SIZE):
+    # sample a path from generate_path starting at (sx, sy, syaw), and scale its lengths to [m]
+    x, y, yaw, directions = \
+        generate_local_course(path.L, path.lengths,
+                              path.ctypes, maxc, step_size * maxc)
+
+    # convert global coordinate
+    path.x = [math.cos(-syaw) * ix + math.sin(-syaw) * iy + sx for (ix, iy) in zip(x, y)]
+    path.y = [-math.sin(-syaw) * ix + math.cos(-syaw) * iy + sy for (ix, iy) in zip(x, y)]
+    path.yaw = [pi_2_pi(iyaw + syaw) for iyaw in yaw]
+    path.directions = directions
+    path.lengths = [l / maxc for l in path.lengths]
+    path.L = path.L / maxc
+
+    return path
+
+
 def set_path(paths, lengths, ctypes):
     path = PATH([], [], 0.0, [], [], [], [])
     path.ctypes = ctypes
@@ -5,7 +5,7 @@ PI = np.pi
 
 
 class Arrow:
-    def __init__(self, x, y, theta, L, c):
+    def __init__(self, x, y, theta, L, c, artists=None):
         angle = np.deg2rad(30)
         d = 0.3 * L
         w = 2
@@ -26,11 +26,17 @@ class Arrow:
         y_hat_end_L = y_hat_start + d * np.sin(theta_hat_L)
         y_hat_end_R = y_hat_start + d * np.sin(theta_hat_R)
 
-        plt.plot([x_start, x_end], [y_start, y_end], color=c, linewidth=w)
-        plt.plot([x_hat_start, x_hat_end_L],
-                 [y_hat_start, y_hat_end_L], color=c, linewidth=w)
-        plt.plot([x_hat_start, x_hat_end_R],
-                 [y_hat_start, y_hat_end_R], color=c, linewidth=w)
+        segments = [([x_start, x_end], [y_start, y_end]),
+                    ([x_hat_start, x_hat_end_L], [y_hat_start, y_hat_end_L]),
+                    ([x_hat_start, x_hat_end_R], [y_hat_start, y_hat_end_R])]
+
+        if artists is None:
+            self.artists = [plt.plot(xs, ys, color=c, linewidth=w)[0] for xs, ys in segments]
+        else:
+            # Move the lines of a previous Arrow to the new pose instead of drawing new ones
+            self.artists = artists
+            for artist, (xs, ys) in zip(artists, segments):
+                artist.set_data(xs, ys)
 
 
 class Car:
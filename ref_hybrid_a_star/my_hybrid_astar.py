@@ -7,11 +7,12 @@ import os
 import sys
 import math
 import heapq
-from heapdict import heapdict
+import itertools
 import time
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.spatial.kdtree as kd
+from matplotlib.animation import FuncAnimation
+from numba import njit
 
 import draw as draw
 import reeds_shepp as rs
@@ -27,6 +28,7 @@ class C:  # Parameter config
     MIN_ANGULAR_VELOCITY = -0.5  # [rad/s] minimum angular velocity
     MAX_CURVATURE_RADIUS = 0.5  # [m] maximum curvature radius
     COLLISION_CHECK_STEP = 2    # skip number for collision check
+    OBSMAP_CACHE_SIZE = 8  # number of obstacle maps cached across planning queries
 
     GEAR_COST = 100.0  # switch back penalty cost
     BACKWARD_COST = 50.0  # backward penalty cost
@@ -42,13 +44,6 @@ class C:  # Parameter config
     TR = 0.2  # [m] Tyre radius
     TW = 0.2  # [m] Tyre width
 
-class HolonomicNode:
-    def __init__(self, x, y, cost, pind):
-        self.x = x  # x position of node
-        self.y = y  # y position of node
-        self.cost = cost  # g cost of node
-        self.pind = pind  # parent index of node
-
 class Node:
     def __init__(self, xind, yind, yawind, direction, x, y,
                  yaw, directions, steer, cost, pind):
@@ -67,7 +62,7 @@ class Node:
 
 class Para:
     def __init__(self, minx, miny, minyaw, maxx, maxy, maxyaw,
-                 xw, yw, yaww, xyreso, yawreso, ox, oy, kdtree):
+                 xw, yw, yaww, xyreso, yawreso, ox_grid, oy_grid, obsgrid):
         self.minx = minx
         self.miny = miny
         self.minyaw = minyaw
@@ -79,9 +74,11 @@ class Para:
         self.yaww = yaww
         self.xyreso = xyreso
         self.yawreso = yawreso
-        self.ox = ox
-        self.oy = oy
-        self.kdtree = kdtree
+        self.inv_xyreso = 1.0 / xyreso
+        self.inv_yawreso = 1.0 / yawreso
+        self.ox_grid = ox_grid
+        self.oy_grid = oy_grid
+        self.obsgrid = obsgrid
 
 
 class Path:
@@ -95,129 +92,204 @@ class Path:
 
 class QueuePrior:
     def __init__(self):
-        self.queue = heapdict()
+        self.queue = []  # binary heap of (priority, count, item)
+        self.entry = {}  # item -> count of its latest push, older entries are stale
+        self.count = itertools.count()
 
     def empty(self):
-        return len(self.queue) == 0  # if Q is empty
+        return len(self.entry) == 0  # if Q is empty
 
     def put(self, item, priority):
-        self.queue[item] = priority  # push 
+        count = next(self.count)
+        self.entry[item] = count
+        heapq.heappush(self.queue, (priority, count, item))  # push, re-putting an item makes its old entry stale
 
     def get(self):
-        return self.queue.popitem()[0]  # pop out element with smallest priority
+        while True:
+            _, count, item = heapq.heappop(self.queue)  # pop out element with smallest priority
+            if self.entry.get(item) == count:
+                del self.entry[item]
+                return item
 
 def get_motion():
     motion = [[-1, 0], [-1, 1], [0, 1], [1, 1],
               [1, 0], [1, -1], [0, -1], [-1, -1]]
+    motion_cost = [math.hypot(u[0], u[1]) for u in motion]
+
+    return motion, motion_cost
+
+# 8-connected motion table and step costs for the holonomic heuristic
+MOTION, MOTION_COST = get_motion()
+MOTION = np.array(MOTION, dtype=np.int8)
+MOTION_COST = np.array(MOTION_COST, dtype=np.float32)
+
+OBSMAP_CACHE = {}  # (radius, xyreso, obstacle grid) -> obsmap, reused by queries on the same map
 
-    return motion
+def obstacles_map(P, rr, chunk_size=1024):
+    xs = np.arange(P.xw) + P.minx
+    ys = np.arange(P.yw) + P.miny
+    r2 = (rr / P.xyreso) ** 2
 
-def obstacles_map(P, rr):
-    # Compute Grid Index for obstacles
-    ox_grid = [round(x / P.xyreso) for x in P.ox]
-    oy_grid = [round(y / P.xyreso) for y in P.oy]
+    # Grid index of every obstacle, rounded as for the collision grid
+    ox_grid = np.rint(P.ox_grid).astype(np.int64)
+    oy_grid = np.rint(P.oy_grid).astype(np.int64)
 
-    obsmap = [[False for _ in range(P.yw)] for _ in range(P.xw)]
+    obsmap = np.zeros((P.xw, P.yw), dtype=np.bool_)
+
+    # Tile over obstacles to bound the (xw, yw, chunk_size) distance buffer
+    for i in range(0, len(ox_grid), chunk_size):
+        ox_chunk = ox_grid[i:i + chunk_size]
+        oy_chunk = oy_grid[i:i + chunk_size]
+        d2 = (xs[:, None, None] - ox_chunk[None, None, :]) ** 2 + \
+             (ys[None, :, None] - oy_chunk[None, None, :]) ** 2
+        obsmap |= (d2 <= r2).any(axis=2)
 
-    for x in range(P.xw):
-        xx = x + P.minx
-        for y in range(P.yw):
-            yy = y + P.miny
-            for oxx, oyy in zip(ox_grid, oy_grid):
-                if math.hypot(oxx - xx, oyy - yy) <= rr / P.xyreso:
-                    obsmap[x][y] = True
-                    break
     return obsmap
 
 def calc_holonomic_heuristic_with_obstacle(node, P, radius):
-    
-    n_goal = HolonomicNode(round(node.x[-1] / P.xyreso), round(node.y[-1] / P.xyreso), 0.0, -1)
+    gx = quantize(node.x[-1], P.inv_xyreso) - P.minx
+    gy = quantize(node.y[-1], P.inv_xyreso) - P.miny
 
-    motion = get_motion()
+    # The obstacle map depends only on the map, so replanning on the same map reuses it
+    key = (radius, P.xyreso, P.ox_grid.tobytes(), P.oy_grid.tobytes())
 
-    obsmap = obstacles_map(P, radius)
+    if key not in OBSMAP_CACHE:
+        if len(OBSMAP_CACHE) >= C.OBSMAP_CACHE_SIZE:
+            OBSMAP_CACHE.pop(next(iter(OBSMAP_CACHE)))  # drop the oldest map
+        OBSMAP_CACHE[key] = obstacles_map(P, radius)
 
-    open_set, closed_set = dict(), dict()
-    open_set[calc_holonomic_index(n_goal, P)] = n_goal
+    obsmap = OBSMAP_CACHE[key]
 
-    q_priority = []
-    heapq.heappush(q_priority, (n_goal.cost, calc_holonomic_index(n_goal, P)))
+    return dijkstra(obsmap, gx, gy)
 
-    while True:
-        if not open_set:
-            break
+@njit(cache=True)
+def dijkstra(obsmap, gx, gy):
+    # Dijkstra from the goal over the obstacle grid, with a binary heap stored as two parallel arrays.
+    # Stale heap entries are skipped on pop instead of decreasing their key.
+    # Cells are addressed by their flat index x * yw + y, so a neighbour is the cell index plus a fixed offset.
+    xw, yw = obsmap.shape
+
+    obs = obsmap.ravel()
+    hmap = np.full(xw * yw, np.inf, dtype=np.float32)
+    closed = np.zeros(xw * yw, dtype=np.bool_)
+
+    offsets = np.empty(MOTION.shape[0], dtype=np.int32)
+    for i in range(MOTION.shape[0]):
+        offsets[i] = MOTION[i, 0] * yw + MOTION[i, 1]
+
+    heap_cost = np.empty(MOTION.shape[0] * xw * yw + 1, dtype=np.float32)
+    heap_ind = np.empty(MOTION.shape[0] * xw * yw + 1, dtype=np.int32)
+
+    hmap[gx * yw + gy] = 0.0
+    size = heap_push(heap_cost, heap_ind, 0, 0.0, gx * yw + gy)
+
+    while size > 0:
+        cost, ind, size = heap_pop(heap_cost, heap_ind, size)
 
-        _, ind = heapq.heappop(q_priority)
-        n_curr = open_set[ind]
-        closed_set[ind] = n_curr
-        open_set.pop(ind)
+        if closed[ind]:
+            continue
+
+        closed[ind] = True
+        x, y = ind // yw, ind % yw
 
-        for i in range(len(motion)):
-            node = HolonomicNode(n_curr.x + motion[i][0],
-                        n_curr.y + motion[i][1],
-                        n_curr.cost + u_cost(motion[i]), ind)
+        for i in range(MOTION.shape[0]):
+            nx = x + MOTION[i, 0]
+            ny = y + MOTION[i, 1]
 
-            if not check_holonomic_node(node, P, obsmap):
+            if nx <= 0 or nx >= xw or ny <= 0 or ny >= yw:
                 continue
 
-            n_ind = calc_holonomic_index(node, P)
-            if n_ind not in closed_set:
-                if n_ind in open_set:
-                    if open_set[n_ind].cost > node.cost:
-                        open_set[n_ind].cost = node.cost
-                        open_set[n_ind].pind = ind
-                else:
-                    open_set[n_ind] = node
-                    heapq.heappush(q_priority, (node.cost, calc_holonomic_index(node, P)))
+            n_ind = ind + offsets[i]
 
-    hmap = [[np.inf for _ in range(P.yw)] for _ in range(P.xw)]
+            if obs[n_ind] or closed[n_ind]:
+                continue
 
-    for n in closed_set.values():
-        hmap[n.x - P.minx][n.y - P.miny] = n.cost
+            n_cost = cost + MOTION_COST[i]
 
-    return hmap
+            if n_cost < hmap[n_ind]:
+                hmap[n_ind] = n_cost
+                size = heap_push(heap_cost, heap_ind, size, n_cost, n_ind)
 
-def check_holonomic_node(node, P, obsmap):
-    if node.x <= P.minx or node.x >= P.maxx or \
-            node.y <= P.miny or node.y >= P.maxy:
-        return False
+    return hmap.reshape((xw, yw))
 
-    if obsmap[node.x - P.minx][node.y - P.miny]:
-        return False
+@njit(cache=True)
+def heap_push(heap_cost, heap_ind, size, cost, ind):
+    i = size
+    while i > 0:
+        parent = (i - 1) // 2
+        if heap_cost[parent] <= cost:
+            break
+        heap_cost[i] = heap_cost[parent]
+        heap_ind[i] = heap_ind[parent]
+        i = parent
 
-    return True
+    heap_cost[i] = cost
+    heap_ind[i] = ind
+
+    return size + 1
+
+@njit(cache=True)
+def heap_pop(heap_cost, heap_ind, size):
+    cost, ind = heap_cost[0], heap_ind[0]
+
+    size -= 1
+    last_cost, last_ind = heap_cost[size], heap_ind[size]
+
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap_cost[child + 1] < heap_cost[child]:
+            child += 1
+        if heap_cost[child] >= last_cost:
+            break
+        heap_cost[i] = heap_cost[child]
+        heap_ind[i] = heap_ind[child]
+        i = child
+
+    heap_cost[i] = last_cost
+    heap_ind[i] = last_ind
 
-def u_cost(u):
-    return math.hypot(u[0], u[1])
+    return cost, ind, size
 
 def hybrid_astar_planning(sx, sy, syaw, gx, gy, gyaw, ox_grid, oy_grid, xyreso, yawreso, radius):
-    sxr, syr = round(sx / xyreso), round(sy / xyreso)
-    gxr, gyr = round(gx / xyreso), round(gy / xyreso)
-    syawr = round(rs.pi_2_pi(syaw) / yawreso)
-    gyawr = round(rs.pi_2_pi(gyaw) / yawreso)
+    P = calc_parameters(ox_grid, oy_grid, xyreso, yawreso)
+
+    sxr, syr = quantize(sx, P.inv_xyreso), quantize(sy, P.inv_xyreso)
+    gxr, gyr = quantize(gx, P.inv_xyreso), quantize(gy, P.inv_xyreso)
+    syawr = quantize(rs.pi_2_pi(syaw), P.inv_yawreso)
+    gyawr = quantize(rs.pi_2_pi(gyaw), P.inv_yawreso)
 
     nstart = Node(sxr, syr, syawr, 1, [sx], [sy], [syaw], [1], 0.0, 0.0, -1)
     ngoal = Node(gxr, gyr, gyawr, 1, [gx], [gy], [gyaw], [1], 0.0, 0.0, -1)
 
-    P = calc_parameters(ox_grid, oy_grid, xyreso, yawreso)
-
     hmap = calc_holonomic_heuristic_with_obstacle(ngoal, P, radius)
 
     steer_set, direc_set = calc_motion_set()
-    open_set, closed_set = {calc_index(nstart, P): nstart}, {}
+
+    # Search state indexed by calc_index: best g cost, closed flag and node of every grid cell.
+    # (yawind - minyaw) spans [0, yaww], hence the extra yaw layer.
+    n_ind = P.xw * P.yw * (P.yaww + 1)
+    g_cost = np.full(n_ind, np.inf)
+    closed = np.zeros(n_ind, dtype=np.bool_)
+    nodes = np.empty(n_ind, dtype=object)
+
+    ind = calc_index(nstart, P)
+    nodes[ind] = nstart
+    g_cost[ind] = nstart.cost
 
     qp = QueuePrior()
-    qp.put(calc_index(nstart, P), calc_hybrid_cost(nstart, hmap, P))
+    qp.put(ind, calc_hybrid_cost(nstart, hmap, P))
 
     count = 1
     while True:
-        if not open_set:
+        if qp.empty():
             return None
 
         ind = qp.get()
-        n_curr = open_set[ind]
-        closed_set[ind] = n_curr
-        open_set.pop(ind)
+        n_curr = nodes[ind]
+        closed[ind] = True
 
         update, fpath = update_node_with_analystic_expantion(n_curr, ngoal, P)
 
@@ -226,26 +298,23 @@ def hybrid_astar_planning(sx, sy, syaw, gx, gy, gyaw, ox_grid, oy_grid, xyreso,
             fnode = fpath
             break
 
-        for i in range(len(steer_set)):
-            node = calc_next_node(n_curr, ind, steer_set[i], direc_set[i], P)
+        for u, d in zip(steer_set, direc_set):
+            node = calc_next_node(n_curr, ind, u, d, P)
 
             if not node:
                 continue
 
             node_ind = calc_index(node, P)
 
-            if node_ind in closed_set:
+            if closed[node_ind]:
                 continue
 
-            if node_ind not in open_set:
-                open_set[node_ind] = node
+            if g_cost[node_ind] > node.cost:
+                nodes[node_ind] = node
+                g_cost[node_ind] = node.cost
                 qp.put(node_ind, calc_hybrid_cost(node, hmap, P))
-            else:
-                if open_set[node_ind].cost > node.cost:
-                    open_set[node_ind] = node
-                    qp.put(node_ind, calc_hybrid_cost(node, hmap, P))
         count += 1
-    return extract_path(closed_set, fnode, nstart)
+    return extract_path(nodes, fnode, nstart)
 
 
 def extract_path(closed, ngoal, nstart):
@@ -254,10 +323,10 @@ def extract_path(closed, ngoal, nstart):
     node = ngoal
 
     while True:
-        rx += node.x[::-1]
-        ry += node.y[::-1]
-        ryaw += node.yaw[::-1]
-        direc += node.directions[::-1]
+        rx.extend(node.x[::-1])
+        ry.extend(node.y[::-1])
+        ryaw.extend(node.yaw[::-1])
+        direc.extend(node.directions[::-1])
         cost += node.cost
 
         if is_same_grid(node, nstart):
@@ -280,18 +349,28 @@ def calc_next_node(n_curr, c_id, u, d, P):
     step = C.XY_RESO * 2
 
     nlist = math.ceil(step / C.MOVE_STEP)
-    xlist = [n_curr.x[-1] + d * C.MOVE_STEP * math.cos(n_curr.yaw[-1])]
-    ylist = [n_curr.y[-1] + d * C.MOVE_STEP * math.sin(n_curr.yaw[-1])]
-    yawlist = [rs.pi_2_pi(n_curr.yaw[-1] + d * C.MOVE_STEP * u)]
+
+    # Yaw advances by a constant increment every substep, so the heading's cos/sin are
+    # rotated by that increment instead of being re-evaluated with trig at each substep.
+    # nlist is only a couple of substeps, too few for NumPy array calls to pay off
+    dyaw = d * C.MOVE_STEP * u
+    cos_dyaw, sin_dyaw = math.cos(dyaw), math.sin(dyaw)
+    cos_yaw, sin_yaw = math.cos(n_curr.yaw[-1]), math.sin(n_curr.yaw[-1])
+
+    xlist = [n_curr.x[-1] + d * C.MOVE_STEP * cos_yaw]
+    ylist = [n_curr.y[-1] + d * C.MOVE_STEP * sin_yaw]
+    yawlist = [rs.pi_2_pi(n_curr.yaw[-1] + dyaw)]
 
     for i in range(nlist - 1):
-        xlist.append(xlist[i] + d * C.MOVE_STEP * math.cos(yawlist[i]))
-        ylist.append(ylist[i] + d * C.MOVE_STEP * math.sin(yawlist[i]))
-        yawlist.append(rs.pi_2_pi(yawlist[i] + d * C.MOVE_STEP * u))
+        cos_yaw, sin_yaw = cos_yaw * cos_dyaw - sin_yaw * sin_dyaw, \
+                           sin_yaw * cos_dyaw + cos_yaw * sin_dyaw
+        xlist.append(xlist[i] + d * C.MOVE_STEP * cos_yaw)
+        ylist.append(ylist[i] + d * C.MOVE_STEP * sin_yaw)
+        yawlist.append(rs.pi_2_pi(yawlist[i] + dyaw))
 
-    xind = round(xlist[-1] / P.xyreso)
-    yind = round(ylist[-1] / P.xyreso)
-    yawind = round(yawlist[-1] / P.yawreso)
+    xind = quantize(xlist[-1], P.inv_xyreso)
+    yind = quantize(ylist[-1], P.inv_xyreso)
+    yawind = quantize(yawlist[-1], P.inv_yawreso)
 
     if not is_index_ok(xind, yind, xlist, ylist, yawlist, P):
         return None
@@ -326,11 +405,9 @@ def is_index_ok(xind, yind, xlist, ylist, yawlist, P):
             yind >= P.maxy:
         return False
 
-    ind = range(0, len(xlist), C.COLLISION_CHECK_STEP)
-
-    nodex = [xlist[k] for k in ind]
-    nodey = [ylist[k] for k in ind]
-    nodeyaw = [yawlist[k] for k in ind]
+    nodex = xlist[::C.COLLISION_CHECK_STEP]
+    nodey = ylist[::C.COLLISION_CHECK_STEP]
+    nodeyaw = yawlist[::C.COLLISION_CHECK_STEP]
 
     if is_collision(nodex, nodey, nodeyaw, P):
         return False
@@ -349,7 +426,7 @@ def update_node_with_analystic_expantion(n_curr, ngoal, P):
     fyaw = path.yaw[1:-1]
     fd = path.directions[1:-1]
 
-    fcost = n_curr.cost + calc_rs_path_cost(path)
+    fcost = n_curr.cost + calc_rs_path_cost(path.lengths)
     fpind = calc_index(n_curr, P)
     fsteer = 0.0
 
@@ -363,71 +440,82 @@ def analystic_expantion(node, ngoal, P):
     sx, sy, syaw = node.x[-1], node.y[-1], node.yaw[-1]
     gx, gy, gyaw = ngoal.x[-1], ngoal.y[-1], ngoal.yaw[-1]
 
-    #  Find all possible reeds-shepp paths between current and goal node
-    paths = rs.calc_all_paths(sx, sy, syaw, gx, gy, gyaw, C.MAX_CURVATURE_RADIUS, step_size=C.MOVE_STEP)
-
-    if not paths:
-        return None
-
-    # Find path with lowest cost considering non-holonomic constraints
-    pq = QueuePrior()
-    for path in paths:
-        pq.put(path, calc_rs_path_cost(path))
+    #  Find all possible reeds-shepp paths between current and goal node, only segment lengths and types for now
+    maxc = C.MAX_CURVATURE_RADIUS
+    paths = rs.generate_path([sx, sy, syaw], [gx, gy, gyaw], maxc)
 
-    # Find first path in priority queue that is collision free
-    while not pq.empty():
-        path = pq.get()
-        ind = range(0, len(path.x), C.COLLISION_CHECK_STEP)
+    # Order paths by cost considering non-holonomic constraints, lengths scaled to [m] as calc_path_course does
+    pq = [(calc_rs_path_cost([l / maxc for l in path.lengths]), i, path) for i, path in enumerate(paths)]
+    heapq.heapify(pq)
 
-        pathx = [path.x[k] for k in ind]
-        pathy = [path.y[k] for k in ind]
-        pathyaw = [path.yaw[k] for k in ind]
+    # Find first path in cost order that is collision free, sampling only the paths that get checked
+    while pq:
+        _, _, path = heapq.heappop(pq)
+        rs.calc_path_course(path, sx, sy, syaw, maxc, step_size=C.MOVE_STEP)
 
-        if not is_collision(pathx, pathy, pathyaw, P):
+        if not is_collision(path.x[::C.COLLISION_CHECK_STEP], path.y[::C.COLLISION_CHECK_STEP],
+                            path.yaw[::C.COLLISION_CHECK_STEP], P):
             return path
 
     return None
 
 
 def is_collision(x, y, yaw, P):
-    for ix, iy, iyaw in zip(x, y, yaw):
-        car_length = C.RF + C.RB
-        safety_margin = P.xyreso
-        r = max(car_length / 2.0, C.W / 2.0) + safety_margin
-        dl = (C.RF - C.RB) / 2.0
-
-        cx = ix + dl * math.cos(iyaw)
-        cy = iy + dl * math.sin(iyaw)
-
-        ids = P.kdtree.query_ball_point([cx, cy], r)
-
-        if not ids:
-            continue
-
-        for i in ids:
-            xo = P.ox[i] - cx
-            yo = P.oy[i] - cy
-            dx = xo * math.cos(iyaw) + yo * math.sin(iyaw)
-            dy = -xo * math.sin(iyaw) + yo * math.cos(iyaw)
-
-            if abs(dx) < r  and abs(dy) < C.W / 2 + safety_margin:
-                return True
+    car_length = C.RF + C.RB
+    safety_margin = P.xyreso
+    r = max(car_length / 2.0, C.W / 2.0) + safety_margin
+    dl = (C.RF - C.RB) / 2.0
+
+    return collides(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(yaw, dtype=np.float64),
+                    P.obsgrid, P.minx, P.miny, P.xyreso, dl, r, C.W / 2 + safety_margin)
+
+@njit(cache=True)
+def collides(x, y, yaw, obsgrid, minx, miny, xyreso, dl, r, half_width):
+    # Obstacles are grid points, so the ones within r of a check point are found among the cells
+    # covering [cx - r, cx + r] x [cy - r, cy + r] of the obstacle grid, then box tested in the vehicle frame
+    xw, yw = obsgrid.shape
+
+    for k in range(x.shape[0]):
+        cos_yaw, sin_yaw = math.cos(yaw[k]), math.sin(yaw[k])
+        cx = x[k] + dl * cos_yaw
+        cy = y[k] + dl * sin_yaw
+
+        i0 = max(math.floor((cx - r) / xyreso) - minx, 0)
+        i1 = min(math.ceil((cx + r) / xyreso) - minx, xw - 1)
+        j0 = max(math.floor((cy - r) / xyreso) - miny, 0)
+        j1 = min(math.ceil((cy + r) / xyreso) - miny, yw - 1)
+
+        for i in range(i0, i1 + 1):
+            xo = (i + minx) * xyreso - cx
+            for j in range(j0, j1 + 1):
+                if not obsgrid[i, j]:
+                    continue
+
+                yo = (j + miny) * xyreso - cy
+                if xo * xo + yo * yo > r * r:
+                    continue
+
+                dx = xo * cos_yaw + yo * sin_yaw
+                dy = -xo * sin_yaw + yo * cos_yaw
+
+                if abs(dx) < r and abs(dy) < half_width:
+                    return True
 
     return False
 
-def calc_rs_path_cost(rspath):
+def calc_rs_path_cost(lengths):
     cost = 0.0
 
     # Distance cost
-    for lr in rspath.lengths:
+    for lr in lengths:
         if lr >= 0:
             cost += 1
         else:
             cost += abs(lr) * C.BACKWARD_COST
 
     # Direction change cost
-    for i in range(len(rspath.lengths) - 1):
-        if rspath.lengths[i] * rspath.lengths[i + 1] < 0.0:
+    for i in range(len(lengths) - 1):
+        if lengths[i] * lengths[i + 1] < 0.0:
             cost += C.GEAR_COST
 
     return cost
@@ -441,13 +529,14 @@ def calc_hybrid_cost(node, hmap, P):
 
 
 def calc_motion_set():
-    angular_velocities = np.arange(C.MIN_ANGULAR_VELOCITY, C.MAX_ANGULAR_VELOCITY, (C.MAX_ANGULAR_VELOCITY - C.MIN_ANGULAR_VELOCITY) / C.N_STEER)
+    angular_velocities = np.linspace(C.MIN_ANGULAR_VELOCITY, C.MAX_ANGULAR_VELOCITY, int(C.N_STEER), endpoint=False)
     
-    steer = list(angular_velocities) + [0.0] + list(-angular_velocities)
-    direc = [1.0 for _ in range(len(steer))] + [-1.0 for _ in range(len(steer))]
-    steer = steer + steer
+    steer = np.concatenate([angular_velocities, [0.0], -angular_velocities])
+    direc = np.concatenate([np.ones(len(steer)), -np.ones(len(steer))])
+    steer = np.concatenate([steer, steer])
 
-    return steer, direc
+    # Python floats, as calc_next_node does scalar math on them
+    return steer.tolist(), direc.tolist()
 
 
 def is_same_grid(node1, node2):
@@ -458,8 +547,11 @@ def is_same_grid(node1, node2):
 
     return True
 
-def calc_holonomic_index(node, P):
-    return (node.y - P.miny) * P.xw + (node.x - P.minx)
+def quantize(v, inv_reso):
+    # Grid index of v, multiplying by the precomputed inverse resolution instead of dividing.
+    # round() keeps the half-to-even tie rule the planner has always used for grid indices.
+    return round(float(v) * inv_reso)
+
 
 def calc_index(node, P):
     ind = (node.yawind - P.minyaw) * P.xw * P.yw + \
@@ -482,16 +574,19 @@ def calc_parameters(ox_grid, oy_grid, xyreso, yawreso):
     maxyaw = round(C.PI / yawreso)
     yaww = maxyaw - minyaw
 
-    ox = [i * xyreso for i in ox_grid]
-    oy = [i * xyreso for i in oy_grid]
+    ox_grid = np.asarray(ox_grid)
+    oy_grid = np.asarray(oy_grid)
 
-    kdtree = kd.KDTree([[x, y] for x, y in zip(ox, oy)])
+    # Occupancy of every grid point from minx, miny to maxx, maxy, for the collision check
+    obsgrid = np.zeros((maxx - minx + 1, maxy - miny + 1), dtype=np.bool_)
+    obsgrid[np.rint(ox_grid).astype(np.int64) - minx, np.rint(oy_grid).astype(np.int64) - miny] = True
 
     return Para(minx, miny, minyaw, maxx, maxy, maxyaw,
-                xw, yw, yaww, xyreso, yawreso, ox, oy, kdtree)
+                xw, yw, yaww, xyreso, yawreso, ox_grid, oy_grid, obsgrid)
 
 
-def draw_car(x, y, yaw, steer, color='black'):
+def draw_car(x, y, yaw, steer, color='black', artists=None):
+    # Draws new lines when artists is None, otherwise moves the given lines (from a previous call) to the new pose
     car = np.array([[-C.RB, -C.RB, C.RF, C.RF, -C.RB],
                     [C.W / 2, -C.W / 2, -C.W / 2, C.W / 2, C.W / 2]])
 
@@ -530,12 +625,18 @@ def draw_car(x, y, yaw, steer, color='black'):
     rlWheel += np.array([[x], [y]])
     car += np.array([[x], [y]])
 
-    plt.plot(car[0, :], car[1, :], color)
-    plt.plot(frWheel[0, :], frWheel[1, :], color)
-    plt.plot(rrWheel[0, :], rrWheel[1, :], color)
-    plt.plot(flWheel[0, :], flWheel[1, :], color)
-    plt.plot(rlWheel[0, :], rlWheel[1, :], color)
-    draw.Arrow(x, y, yaw, C.WB * 0.8, color)
+    outlines = [car, frWheel, rrWheel, flWheel, rlWheel]
+
+    if artists is None:
+        lines = [plt.plot(outline[0, :], outline[1, :], color)[0] for outline in outlines]
+        arrow = draw.Arrow(x, y, yaw, C.WB * 0.8, color)
+    else:
+        lines = artists[:len(outlines)]
+        for line, outline in zip(lines, outlines):
+            line.set_data(outline[0, :], outline[1, :])
+        arrow = draw.Arrow(x, y, yaw, C.WB * 0.8, color, artists=artists[len(outlines):])
+
+    return lines + arrow.artists
 
 
 def generate_obstacle_in_grid_map():
@@ -598,22 +699,26 @@ def main():
     direction = path.direction
 
     print(len(x))
-    for k in range(len(x)):
-        plt.cla()
-        plt.plot(ox, oy, "sk")
-        plt.plot(x, y, linewidth=1.5, color='r')
 
+    # Static background is drawn once; each frame only moves the car lines (blitting)
+    fig = plt.figure()
+    plt.plot(ox, oy, "sk")
+    plt.plot(x, y, linewidth=1.5, color='r')
+    draw_car(gx, gy, gyaw0, 0.0, 'dimgray')
+    car = draw_car(x[0], y[0], yaw[0], 0.0)
+    plt.title("Hybrid A*")
+    plt.axis("equal")
+
+    def update(k):
         if k < len(x) - 2:
             dy = (yaw[k + 1] - yaw[k]) / C.MOVE_STEP
             steer = rs.pi_2_pi(math.atan(-C.WB * dy / direction[k]))
         else:
             steer = 0.0
 
-        draw_car(gx, gy, gyaw0, 0.0, 'dimgray')
-        draw_car(x[k], y[k], yaw[k], steer)
-        plt.title("Hybrid A*")
-        plt.axis("equal")
-        plt.pause(0.0001)
+        return draw_car(x[k], y[k], yaw[k], steer, artists=car)
+
+    anim = FuncAnimation(fig, update, frames=len(x), interval=1, blit=True, repeat=False)
 
     plt.show()
     print("Done!")